@@ -0,0 +1,80 @@
+import os
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds of quiet to wait for more messages from the same sender before
+# handling them as one batch. Every new message restarts the wait.
+# 0 disables coalescing and every message is handled on its own.
+COALESCE_WINDOW = float(os.getenv("COALESCE_WINDOW", 0))
+
+# Longest a batch waits after its first message, however often the sender
+# keeps writing. Defaults to three windows.
+COALESCE_MAX_WAIT = float(os.getenv("COALESCE_MAX_WAIT", 3 * COALESCE_WINDOW))
+
+# sender_id -> messages waiting for the current window to close.
+pending_messages = {}
+# sender_id -> event loop time the open batch's first message arrived.
+batch_started_at = {}
+# sender_id -> timer task of the currently open window.
+flush_timers = {}
+# sender_id -> lock that keeps each sender's batches sequential.
+sender_locks = {}
+# sender_id -> number of closed batches waiting for or holding the lock.
+batches_in_flight = {}
+# Keeps a reference to running flush tasks so they aren't garbage collected.
+flush_tasks = set()
+
+
+async def coalesce_message(sender_id: str, text: str, handler) -> str:
+    """
+    Queue a message for the sender. Each message (re)starts a debounce window;
+    once the sender has been quiet for COALESCE_WINDOW seconds, or the batch
+    is COALESCE_MAX_WAIT seconds old, handler(sender_id, messages) runs once
+    for everything queued.
+    """
+    now = asyncio.get_running_loop().time()
+    pending_messages.setdefault(sender_id, []).append(text)
+    started_at = batch_started_at.setdefault(sender_id, now)
+    delay = max(0.0, min(COALESCE_WINDOW, started_at + COALESCE_MAX_WAIT - now))
+
+    timer = flush_timers.get(sender_id)
+    if timer is not None:
+        timer.cancel()
+
+    task = asyncio.create_task(flush_after_window(sender_id, handler, delay))
+    flush_timers[sender_id] = task
+    flush_tasks.add(task)
+    task.add_done_callback(flush_tasks.discard)
+    return "queued" if timer is None else "coalesced"
+
+
+async def flush_after_window(sender_id: str, handler, delay: float) -> None:
+    # A newer message cancels this task while it sleeps and starts its own.
+    await asyncio.sleep(delay)
+
+    # Window closed: take the batch before yielding, so messages arriving
+    # from now on open a new window.
+    flush_timers.pop(sender_id, None)
+    batch_started_at.pop(sender_id, None)
+    messages = pending_messages.pop(sender_id, [])
+    if not messages:
+        return
+
+    lock = sender_locks.setdefault(sender_id, asyncio.Lock())
+    batches_in_flight[sender_id] = batches_in_flight.get(sender_id, 0) + 1
+    try:
+        async with lock:
+            logger.info(f"Handling {len(messages)} coalesced messages from {sender_id}")
+            try:
+                # The handler makes blocking LLM/DB calls, keep them off the
+                # event loop so other senders aren't held up.
+                await asyncio.to_thread(handler, sender_id, messages)
+            except Exception as e:
+                logger.error(f"Error handling messages from {sender_id}: {e}")
+    finally:
+        batches_in_flight[sender_id] -= 1
+        if not batches_in_flight[sender_id]:
+            del batches_in_flight[sender_id]
+            sender_locks.pop(sender_id, None)
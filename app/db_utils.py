@@ -1,12 +1,54 @@
 import psycopg2
 import os
+import time
+import random
+import logging
+import threading
 from psycopg2.extras import RealDictCursor
+from psycopg2.extensions import parse_dsn
+from psycopg2.pool import ThreadedConnectionPool, PoolError
 from dotenv import load_dotenv
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 db_uri = os.getenv("POSTGRES_URL")
 
+# Comma separated list of read-replica DSNs. Reads go to the primary when empty.
+replica_uris = [
+    uri.strip()
+    for uri in os.getenv("POSTGRES_REPLICA_URLS", "").split(",")
+    if uri.strip()
+]
+
+# Seconds a user's reads stay pinned to the primary after they save an expense.
+READ_YOUR_WRITES_WINDOW = float(os.getenv("READ_YOUR_WRITES_WINDOW", 5))
+
+# Replicas lagging more than this many seconds behind the primary are skipped.
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", 2))
+
+# Seconds a replica is left alone after a failed connection or lag check.
+REPLICA_RETRY_AFTER = float(os.getenv("REPLICA_RETRY_AFTER", 30))
+
+REPLICA_CONNECT_TIMEOUT = int(os.getenv("REPLICA_CONNECT_TIMEOUT", 2))
+
+# Seconds a replica's lag reading is trusted before it is checked again.
+REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("REPLICA_LAG_CHECK_INTERVAL", 5))
+
+# Maximum open connections kept per replica.
+REPLICA_POOL_SIZE = int(os.getenv("REPLICA_POOL_SIZE", 5))
+
+# user_id -> monotonic time of that user's last write.
+last_write_at = {}
+# replica uri -> monotonic time until which the replica is skipped.
+replica_down_until = {}
+# replica uri -> monotonic time of the last successful lag check.
+replica_checked_at = {}
+# replica uri -> connection pool, created on first use.
+replica_pools = {}
+routing_lock = threading.Lock()
+
 
 def init_db():
     conn = psycopg2.connect(db_uri)
@@ -34,6 +76,129 @@ def init_db():
 conn = init_db()
 
 
+def mark_write(user_id):
+    """Remember that the user just wrote, so their next reads hit the primary."""
+    with routing_lock:
+        last_write_at[str(user_id)] = time.monotonic()
+
+
+def recently_wrote(user_id):
+    """Check whether the user is still inside the read-your-writes window."""
+    if user_id is None:
+        return False
+    now = time.monotonic()
+    with routing_lock:
+        written_at = last_write_at.get(str(user_id))
+        if written_at is None:
+            return False
+        if now - written_at > READ_YOUR_WRITES_WINDOW:
+            del last_write_at[str(user_id)]
+            return False
+        return True
+
+
+def replica_name(uri):
+    """Host and port of a replica, for logs without the credentials."""
+    dsn = parse_dsn(uri)
+    return f"{dsn.get('host', 'localhost')}:{dsn.get('port', 5432)}"
+
+
+def mark_replica_down(uri):
+    with routing_lock:
+        replica_down_until[uri] = time.monotonic() + REPLICA_RETRY_AFTER
+        replica_checked_at.pop(uri, None)
+
+
+def replica_pool(uri):
+    with routing_lock:
+        pool = replica_pools.get(uri)
+        if pool is None:
+            pool = ThreadedConnectionPool(
+                0,
+                REPLICA_POOL_SIZE,
+                uri,
+                connect_timeout=REPLICA_CONNECT_TIMEOUT,
+            )
+            replica_pools[uri] = pool
+        return pool
+
+
+def lag_check_due(uri):
+    with routing_lock:
+        checked_at = replica_checked_at.get(uri)
+    return checked_at is None or time.monotonic() - checked_at > REPLICA_LAG_CHECK_INTERVAL
+
+
+def healthy_replicas():
+    now = time.monotonic()
+    with routing_lock:
+        return [uri for uri in replica_uris if replica_down_until.get(uri, 0) <= now]
+
+
+def replica_lag(cursor):
+    """Seconds the replica is behind the primary, 0 when fully caught up."""
+    cursor.execute(
+        """
+        SELECT CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE COALESCE(
+                EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0
+            )
+        END AS lag
+        """
+    )
+    return float(cursor.fetchone()["lag"])
+
+
+def query_replica(uri, query, params=None):
+    """Run a read query on a replica, or return None if it is down or lagging."""
+    pool = replica_pool(uri)
+    try:
+        conn = pool.getconn()
+    except PoolError:
+        # Every pooled connection is busy, let the primary take this read.
+        return None
+    except psycopg2.OperationalError as e:
+        logger.warning(f"Replica unavailable, skipping {replica_name(uri)}: {e}")
+        mark_replica_down(uri)
+        return None
+
+    broken = False
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        if lag_check_due(uri):
+            lag = replica_lag(cursor)
+            if lag > REPLICA_MAX_LAG:
+                logger.warning(
+                    f"Replica lagging {lag:.1f}s, skipping {replica_name(uri)}"
+                )
+                mark_replica_down(uri)
+                return None
+            with routing_lock:
+                replica_checked_at[uri] = time.monotonic()
+        cursor.execute(query, params)
+        return cursor.fetchall()
+    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+        logger.warning(f"Replica connection lost, skipping {replica_name(uri)}: {e}")
+        broken = True
+        mark_replica_down(uri)
+        return None
+    except psycopg2.Error as e:
+        # e.g. a hot standby cancelling the query on a recovery conflict. The
+        # replica itself is fine, only this read goes to the primary.
+        logger.warning(f"Replica read failed on {replica_name(uri)}: {e}")
+        return None
+    finally:
+        if not broken and not conn.closed:
+            try:
+                # End the read transaction so the pooled connection sees fresh data.
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        pool.putconn(conn, close=broken or bool(conn.closed))
+
+
 def save_to_db(expense_data):
     with psycopg2.connect(db_uri) as conn:
         cursor = conn.cursor()
@@ -52,12 +217,28 @@ def save_to_db(expense_data):
             ),
         )
         conn.commit()
+    mark_write(expense_data["user_id"])
+
 
+def db_query(query, params=None, user_id=None):
+    """
+    Run a read-only query. Goes to a replica when one is configured and the
+    user has not written recently, and falls back to the primary otherwise.
+    """
+    if not recently_wrote(user_id):
+        replicas = healthy_replicas()
+        random.shuffle(replicas)
+        for uri in replicas:
+            result = query_replica(uri, query, params)
+            if result is not None:
+                return result
 
-def db_query(query):
     conn = psycopg2.connect(db_uri)
-    cursor = conn.cursor(cursor_factory=RealDictCursor)
-    cursor.execute(query)
-    result = cursor.fetchall()
+    try:
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(query, params)
+        result = cursor.fetchall()
+    finally:
+        conn.close()
 
     return result
@@ -175,23 +175,23 @@ def save_expense(
 
 def get_expenses_by_category(user_id: str, category: str) -> dict:
     """Get expenses by category."""
-    query = f"""
+    query = """
         SELECT * FROM expensex
-        WHERE user_id = '{user_id}' AND category = '{category.lower()}'
+        WHERE user_id = %s AND category = %s
     """
 
-    expenses = db_query(query)
+    expenses = db_query(query, (str(user_id), category.lower()), user_id=user_id)
 
     return {"status": "success", "expenses": expenses}
 
 
 def get_expenses_by_date(user_id: str, start_date: str, end_date: str) -> dict:
     """Get expenses by date range."""
-    query = f"""
+    query = """
         SELECT * FROM expensex
-        WHERE user_id = '{user_id}' AND date BETWEEN '{start_date}' AND '{end_date}'
+        WHERE user_id = %s AND date BETWEEN %s AND %s
     """
 
-    expenses = db_query(query)
+    expenses = db_query(query, (str(user_id), start_date, end_date), user_id=user_id)
 
     return {"status": "success", "expenses": expenses}
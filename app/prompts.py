@@ -0,0 +1,141 @@
+import logging
+from google.genai import types
+from app.functions import func_config
+
+logger = logging.getLogger(__name__)
+
+# Rough budget for the expense records embedded in the normalizer prompt.
+RECORDS_TOKEN_BUDGET = 1500
+# Gemini averages roughly four characters per token on English text. Bengali
+# and other non-ASCII scripts are counted as a full token per character, so
+# the budget holds for them too.
+CHARS_PER_TOKEN = 4
+
+# Columns sent to the model. id and user_id are left out, they carry no meaning.
+RECORD_COLUMNS = ["date", "category", "price", "description"]
+
+INTENT_INSTRUCTION = (
+    "# Instructions: (Don't use these in response only for reference)"
+    "\n- Use the 'today' date given in the message as date reference."
+    "\n- Example: 'yesterday' (gotokal/গতকাল) will be day before today and 'tomorrow' (agamikal/আগামীকাল) will be day after today."
+    "\n- Week start from Sunday"
+    "\n- Weekend is Friday and Saturday"
+    "\n- For 'save_expense' function price must be given in number format in user query."
+    "\n- Don't use 'save_expense' function if user query doesn't contain price in numeric format."
+    "\n- Disregard insignificant/irrelevant terms related to expenses."
+    "\n- Don't ask for user id, it's given in the message."
+    "\n- The user query may hold several numbered messages. Call one function for every expense or question in them, in message order."
+)
+
+NORMALIZER_INSTRUCTION = (
+    "NOTE: language list: ['english', 'bengali']. Special case: Also reply in bengali if user query is in benglish (Bengali written using English characters)."
+    " Response output must be in the user query language given in the message."
+    " You will be given a list of expenses as a table: the first line holds the column names, every following line is one expense with values separated by '|'."
+    " A final 'omitted' line, if present, summarizes rows that were left out."
+    " Make sure to format the response in a concised (under 200 characters) human readable format. Just plain human like response."
+    " DO NOT include 'Expenses on 2025-04-18 for user 7573277649370618:' this kind of text on the response."
+    " Use currency symbol as Taka '৳'."
+)
+
+# Static instructions live in the configs, so they are built once per process.
+intent_config = func_config.model_copy(
+    update={"system_instruction": INTENT_INSTRUCTION}
+)
+normalizer_config = types.GenerateContentConfig(
+    system_instruction=NORMALIZER_INSTRUCTION,
+)
+
+
+def estimate_tokens(text: str) -> int:
+    non_ascii = sum(1 for char in text if not char.isascii())
+    return (len(text) - non_ascii) // CHARS_PER_TOKEN + non_ascii + 1
+
+
+def to_number(value) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def format_cell(value) -> str:
+    """Keep a value on one table cell: no column separators, no line breaks."""
+    return (
+        str(value or "")
+        .replace("|", "/")
+        .replace("\r\n", " ")
+        .replace("\n", " ")
+        .replace("\r", " ")
+    )
+
+
+def format_row(record: dict) -> str:
+    return "|".join(format_cell(record.get(column)) for column in RECORD_COLUMNS)
+
+
+def serialize_records(records: list, token_budget: int = RECORDS_TOKEN_BUDGET) -> str:
+    """
+    Serialize expense records as a compact '|' separated table sorted by date.
+    Rows that do not fit in the token budget are dropped and summarized on a
+    last line.
+    """
+    if not records:
+        return "no expenses"
+
+    # The database returns rows in no particular order, sort them so the same
+    # expenses are kept under the budget on every run and every replica.
+    records = sorted(
+        records,
+        key=lambda record: (
+            str(record.get("date") or ""),
+            str(record.get("id") or ""),
+        ),
+    )
+
+    lines = ["|".join(RECORD_COLUMNS)]
+    used = estimate_tokens(lines[0])
+    kept = 0
+    for record in records:
+        row = format_row(record)
+        cost = estimate_tokens(row)
+        if used + cost > token_budget:
+            break
+        lines.append(row)
+        used += cost
+        kept += 1
+
+    omitted = records[kept:]
+    if omitted:
+        omitted_total = sum(to_number(record.get("price")) for record in omitted)
+        lines.append(f"omitted: {len(omitted)} rows, total {omitted_total:.2f}")
+        logger.info(f"Records over token budget, omitted {len(omitted)} rows")
+
+    return "\n".join(lines)
+
+
+def intent_prompt(sender_id: str, user_queries: list, current_date: str) -> str:
+    if len(user_queries) == 1:
+        user_query = f"'{user_queries[0]}'"
+    else:
+        user_query = "".join(
+            f"\n{number}. '{query}'" for number, query in enumerate(user_queries, 1)
+        )
+    return f"today: {current_date}\nuser_id: '{sender_id}'\nuser_query: {user_query}"
+
+
+def normalizer_prompt(records: list, query_lang: str) -> str:
+    return (
+        f"User query language: {query_lang}\n"
+        f"Expenses:\n{serialize_records(records)}\n"
+        "Response:"
+    )
+
+
+def log_usage(call: str, response) -> None:
+    """Log the tokens in/out reported by the model for a call."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    logger.info(
+        f"{call} tokens: in={usage.prompt_token_count}, out={usage.candidates_token_count}"
+    )
@@ -6,12 +6,19 @@ import os
 import logging
 from google.genai import types
 from fastapi import HTTPException, APIRouter
+from app.coalescer import COALESCE_WINDOW, coalesce_message
 from app.agent_gai import agent, generate_content_config
 from app.functions import (
     save_expense,
     get_expenses_by_category,
     get_expenses_by_date,
-    func_config,
+)
+from app.prompts import (
+    intent_config,
+    normalizer_config,
+    intent_prompt,
+    normalizer_prompt,
+    log_usage,
 )
 
 # Initialize FastAPI router and load environment variables.
@@ -34,8 +41,6 @@ logger = logging.getLogger(__name__)
 # Global states to manage unpaid warnings.
 unpaid_warned = set()
 
-current_date = date.now().strftime("%Y-%m-%d")
-
 
 def send_fb_message(recipient_id: str, message: dict) -> None:
     """Helper function to send a Facebook message."""
@@ -60,6 +65,124 @@ def is_paid_user(sender_id: str) -> bool:
     return str(sender_id) in paid_ids
 
 
+def run_intent(sender_id: str, intent: str, intent_args: dict, current_date: str) -> str:
+    """
+    Execute a single intent from the model and return the reply text.
+    Raises ValueError with a user facing message when arguments are missing.
+    """
+    if intent == "save_expense":
+        exp_category = intent_args.get("category", "")
+        exp_price = intent_args.get("price", "")
+        exp_description = intent_args.get("description", "")
+
+        save_expense(
+            id=str(uuid.uuid4()),
+            user_id=sender_id,
+            category=exp_category,
+            price=exp_price,
+            description=exp_description,
+            date=current_date,
+        )
+        return "Expense saved successfully."
+
+    elif intent == "get_expense_by_category":
+        category = intent_args.get("category", "")
+
+        query_lang = intent_args.get("language", "")
+        logger.info(f"Language: {query_lang}")
+
+        if not category:
+            raise ValueError("Please tell me which category to look up.")
+
+        records = get_expenses_by_category(user_id=sender_id, category=category)
+
+        normalizer_response = agent.models.generate_content(
+            model=TEXT_MODEL,
+            contents=normalizer_prompt(records["expenses"], query_lang),
+            config=normalizer_config,
+        )
+        log_usage("Normalizer", normalizer_response)
+        normalized_text = normalizer_response.text
+        logger.info(f"Normalizer response: {normalized_text}")
+
+        return normalized_text
+
+    elif intent == "get_expense_by_date":
+        start_date = intent_args.get("start_date", "")
+        end_date = intent_args.get("end_date", "")
+
+        query_lang = intent_args.get("language", "")
+        logger.info(f"Language: {query_lang}")
+
+        if not start_date or not end_date:
+            raise ValueError("Please tell me which dates to look up.")
+
+        records = get_expenses_by_date(
+            user_id=sender_id, start_date=start_date, end_date=end_date
+        )
+
+        normalizer_response = agent.models.generate_content(
+            model=TEXT_MODEL,
+            contents=normalizer_prompt(records["expenses"], query_lang),
+            config=normalizer_config,
+        )
+        log_usage("Normalizer", normalizer_response)
+
+        return normalizer_response.text
+
+    return "Sorry, I didn't understand that."
+
+
+def handle_text_queries(sender_id: str, user_queries: list) -> list:
+    """
+    Run one intent call for the given messages, execute every function call
+    the model returns in order and send all replies as a single message.
+    A failing function call gets a short error reply of its own, the others
+    are still executed and answered.
+    """
+    current_date = date.now().strftime("%Y-%m-%d")
+
+    try:
+        intent_response = agent.models.generate_content(
+            model=TEXT_MODEL,
+            contents=intent_prompt(sender_id, user_queries, current_date),
+            config=intent_config,
+        )
+    except Exception as e:
+        logger.error(f"Intent call failed for {sender_id}: {e}")
+        send_fb_message(
+            sender_id, {"text": "Sorry, something went wrong. Please try again."}
+        )
+        return ["error"]
+    log_usage("Intent", intent_response)
+    # logger.info(f"Intent response: {intent_response}")
+
+    intents = []
+    replies = []
+    for function_call in intent_response.function_calls or []:
+        intent_args = function_call.args
+        logger.info(f"Function params: {intent_args}")
+
+        intent = function_call.name
+        logger.info(f"Intent: {intent}")
+
+        intents.append(intent)
+        try:
+            replies.append(run_intent(sender_id, intent, intent_args, current_date))
+        except ValueError as e:
+            logger.warning(f"Invalid {intent} arguments from {sender_id}: {e}")
+            replies.append(f"Sorry, I couldn't do that. {e}")
+        except Exception as e:
+            logger.error(f"Error running {intent} for {sender_id}: {e}")
+            replies.append("Sorry, I couldn't process one of your messages.")
+
+    if not replies:
+        replies.append("Sorry, I didn't understand that.")
+
+    send_fb_message(sender_id, {"text": "\n\n".join(replies)})
+    return intents
+
+
 @router.post("/webhook")
 async def receive_message(data: dict):
     sender_id = None
@@ -138,6 +261,8 @@ async def receive_message(data: dict):
                     detail="Failed to parse the JSON response from the model.",
                 )
 
+            current_date = date.now().strftime("%Y-%m-%d")
+
             # Save expense
             save_expense(
                 id=str(uuid.uuid4()),
@@ -167,105 +292,18 @@ async def receive_message(data: dict):
                 )
             logger.info(f"Received user query: ********{user_query}********")
 
-            current_date = date.now().strftime("%Y-%m-%d")
-
-            intent_prompt = (
-                "\n# Instructions: (Don't use these in response only for reference)"
-                f"\n# Note: 'today': {current_date}"
-                "\n- Use Current Date as date reference."
-                f"\n- Example: 'yesterday' (gotokal/গতকাল) will be day before {current_date} and 'tomorrow' (agamikal/আগামীকাল) will be day after {current_date}."
-                "\n- Week start from Sunday"
-                "\n- Weekend is Friday and Saturday"
-                "\n- For 'save_expense' function price must be given in number format in user query."
-                "\n- Don't use 'save_expense' function if user query doesn't contain price in numeric format."
-                "\n- Disregard insignificant/irrelevant terms related to expenses."
-                "\n- Don't ask for user id, it's given below."
-                f"user_id: '{sender_id}', \nuser_query: '{user_query}'"
-            )
-
-            intent_response = agent.models.generate_content(
-                model=TEXT_MODEL,
-                contents=intent_prompt,
-                config=func_config,
-            )
-            # logger.info(f"Intent response: {intent_response}")
-
-            intent_args = intent_response.function_calls[0].args
-            logger.info(f"Function params: {intent_args}")
-
-            intent = intent_response.function_calls[0].name
-            logger.info(f"Intent: {intent}")
-
-            # Execute based on intent
-            if intent == "save_expense":
-                exp_category = intent_args.get("category", "")
-                exp_price = intent_args.get("price", "")
-                exp_description = intent_args.get("description", "")
-
-                save_expense(
-                    id=str(uuid.uuid4()),
-                    user_id=sender_id,
-                    category=exp_category,
-                    price=exp_price,
-                    description=exp_description,
-                    date=current_date,
+            if COALESCE_WINDOW > 0:
+                status = await coalesce_message(
+                    sender_id, user_query, handle_text_queries
                 )
-                send_fb_message(sender_id, {"text": "Expense saved successfully."})
-
-            elif intent == "get_expense_by_category":
-                category = intent_args.get("category", "")
-
-                query_lang = intent_args.get("language", "")
-                logger.info(f"Language: {query_lang}")
-
-                if not category:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="Category not provided in the intent response.",
-                    )
-
-                records = get_expenses_by_category(user_id=sender_id, category=category)
-
-                normalizer_prompt = f"NOTE: language list: ['english', 'bengali']. Special case: Also reply in bengali if user query is in benglish (Bengali written using English characters). User query language: {query_lang}.\nSo response output must be in {query_lang} language. You have been given a list of expenses:\n\n{records}.\n\n Make sure to format the response in a concised (under 200 characters) human readable format. Just plain human like response. DO NOT include 'Expenses on 2025-04-18 for user 7573277649370618:' this kind of text on the response. Use currency symbol as Taka '৳'. Response:"
-
-                normalized_text = agent.models.generate_content(
-                    model=TEXT_MODEL,
-                    contents=normalizer_prompt,
-                ).text
-                logger.info(f"Normalizer response: {normalized_text}")
-
-                send_fb_message(sender_id, {"text": normalized_text})
-
-            elif intent == "get_expense_by_date":
-                start_date = intent_args.get("start_date", "")
-                end_date = intent_args.get("end_date", "")
-
-                query_lang = intent_args.get("language", "")
-                logger.info(f"Language: {query_lang}")
-
-                if not start_date or not end_date:
-                    raise HTTPException(
-                        status_code=400,
-                        detail="Date range not provided in the intent response.",
-                    )
-
-                records = get_expenses_by_date(
-                    user_id=sender_id, start_date=start_date, end_date=end_date
-                )
-
-                normalizer_prompt = f"NOTE: language list: ['english', 'bengali']. Special case: Also reply in bengali if user query is in benglish (Bengali written using English characters). User query language: {query_lang}.\nSo response output must be in {query_lang} language. You have been given a list of expenses:\n\n{records}.\n\n Make sure to format the response in a concised (under 200 characters) human readable format. Just plain human like response. DO NOT include 'Expenses on 2025-04-18 for user 7573277649370618:' this kind of text on the response. Use currency symbol as Taka '৳'. Response:"
-
-                normalizer = agent.models.generate_content(
-                    model=TEXT_MODEL,
-                    contents=normalizer_prompt,
-                ).text
-
-                send_fb_message(sender_id, {"text": normalizer})
+                return {"status": status, "sender_id": sender_id}
 
-            else:
-                send_fb_message(sender_id, {"text": "Sorry, I didn't understand that."})
+            intents = handle_text_queries(sender_id, [user_query])
 
-            return {"status": intent, "sender_id": sender_id}
+            return {
+                "status": ",".join(intents) or "unknown",
+                "sender_id": sender_id,
+            }
 
         # No matching handler
         return {"status": "no_action", "sender_id": sender_id}
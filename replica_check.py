@@ -0,0 +1,64 @@
+import time
+import uuid
+from app import db_utils
+from app.db_utils import save_to_db, db_query
+
+# Run with POSTGRES_URL pointing at the primary and POSTGRES_REPLICA_URLS at a
+# streaming replica of it, e.g. two local Postgres instances on 5432 and 5433.
+
+SERVER_QUERY = "SELECT inet_server_port() AS port, pg_is_in_recovery() AS replica"
+
+
+def served_by(user_id=None):
+    row = db_query(SERVER_QUERY, user_id=user_id)[0]
+    return "replica" if row["replica"] else "primary"
+
+
+def check():
+    assert db_utils.replica_uris, "Set POSTGRES_REPLICA_URLS to run this check."
+    user_id = f"replica_check_{uuid.uuid4().hex[:8]}"
+    expense_id = str(uuid.uuid4())
+
+    print("Read before any write:", served_by(user_id))
+    assert served_by(user_id) == "replica"
+
+    save_to_db(
+        {
+            "id": expense_id,
+            "user_id": user_id,
+            "date": time.strftime("%Y-%m-%d"),
+            "price": "60",
+            "category": "food",
+            "description": "replica check",
+        }
+    )
+
+    # Read-your-writes: the new row must be visible straight away.
+    print("Read right after write:", served_by(user_id))
+    assert served_by(user_id) == "primary"
+    rows = db_query(
+        "SELECT * FROM expensex WHERE id = %s", (expense_id,), user_id=user_id
+    )
+    assert len(rows) == 1, "Expense not visible right after saving it."
+
+    time.sleep(db_utils.READ_YOUR_WRITES_WINDOW + 0.5)
+    print("Read after the window:", served_by(user_id))
+    assert served_by(user_id) == "replica"
+
+    # Fallback: an unreachable replica must not break reads.
+    replica_uris = db_utils.replica_uris
+    db_utils.replica_uris = ["postgresql://localhost:1/expensex"]
+    try:
+        print("Read with replica down:", served_by(user_id))
+        assert served_by(user_id) == "primary"
+    finally:
+        db_utils.replica_uris = replica_uris
+
+    with db_utils.conn.cursor() as cursor:
+        cursor.execute("DELETE FROM expensex WHERE id = %s", (expense_id,))
+    db_utils.conn.commit()
+    print("Replica routing checks passed.")
+
+
+if __name__ == "__main__":
+    check()